@@ -8,12 +8,21 @@ LOC, CCN, MI, anti-patterns, and API surface area. Uses drupalisms.php for all a
 Supports multi-repo analysis from repos_config.json.
 """
 
+import argparse
+import functools
+import hashlib
+import heapq
 import json
 import os
 import re
+import select
 import shutil
 import subprocess
 import sys
+import tarfile
+from bisect import bisect_right
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
@@ -21,6 +30,15 @@ from typing import Optional
 
 # Configuration
 DISTRIBUTION_START_DATE = datetime(2015, 10, 1)  # yusaopeny first commit
+CLONE_WORKERS = 8  # Concurrent git clone/fetch operations during setup
+
+# Only export what drupalisms.php actually reads: PHP sources (all the
+# extensions findPhpFiles() scans) plus the YAML files it parses for
+# services and extension-point formats. Skips images/JS/CSS/vendor blobs.
+EXPORT_PATHSPECS = [
+    "*.php", "*.module", "*.inc", "*.install", "*.theme", "*.profile",
+    "*.engine", "*.yml",
+]
 
 
 class Colors:
@@ -47,15 +65,20 @@ def log_debug(message: str):
         print(f"[DEBUG] {message}", flush=True)
 
 
-def run_command(cmd: list[str], cwd: Optional[str] = None, capture: bool = True) -> tuple[int, str, str]:
-    """Run a shell command and return (returncode, stdout, stderr)."""
+def run_command(cmd: list[str], cwd: Optional[str] = None, capture: bool = True,
+                env: Optional[dict] = None) -> tuple[int, str, str]:
+    """Run a shell command and return (returncode, stdout, stderr).
+
+    env entries are merged over os.environ for the child process.
+    """
     try:
         result = subprocess.run(
             cmd,
             cwd=cwd,
             capture_output=capture,
             text=True,
-            timeout=600  # 10 minute timeout
+            timeout=600,  # 10 minute timeout
+            env={**os.environ, **env} if env else None
         )
         return result.returncode, result.stdout, result.stderr
     except subprocess.TimeoutExpired:
@@ -64,6 +87,47 @@ def run_command(cmd: list[str], cwd: Optional[str] = None, capture: bool = True)
         return 1, "", str(e)
 
 
+# Network git commands run inside pool workers, where an interactive
+# credential prompt would hang the whole fan-out; fail fast instead.
+GIT_NETWORK_ENV = {"GIT_TERMINAL_PROMPT": "0"}
+
+
+def run_command_stream(cmd: list[str], cwd: Optional[str] = None):
+    """Yield stdout lines from a command as they are produced.
+
+    Unlike run_command this overlaps the child's output with our parsing
+    and never holds the whole stdout in memory - full git logs of large
+    repos run to tens of MB. Raises CalledProcessError after the last
+    line if the command exited nonzero.
+    """
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True)
+    try:
+        yield from proc.stdout
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+def remove_tree(path: Path):
+    """Delete a directory tree, preferring coreutils rm over shutil.rmtree.
+
+    rm -rf walks with openat()/unlinkat() and no per-file Python overhead,
+    which is markedly faster on the tens of thousands of small files a
+    snapshot export leaves behind.
+    """
+    if not path.exists():
+        return
+    if os.name == "posix":
+        code, _, err = run_command(["rm", "-rf", str(path)])
+        if code == 0:
+            return
+        log_debug(f"rm -rf failed for {path}: {err}")
+    shutil.rmtree(path, ignore_errors=True)
+
+
 def load_config(project_dir: Path) -> dict:
     """Load repos_config.json."""
     config_file = project_dir / "repos_config.json"
@@ -91,16 +155,24 @@ def setup_drupal_org_repo(repos_dir: Path, module: str) -> Optional[Path]:
 
     if repo_dir.exists():
         log_info(f"Updating drupal.org/{module}...")
-        code, _, err = run_command(["git", "fetch", "origin", "--tags"], cwd=str(repo_dir))
+        # One fetch with an explicit refspec moves refs/heads/* forward in
+        # the bare repo directly - no symbolic-ref/update-ref follow-up,
+        # and --prune/--force keep deleted or rewritten branches honest.
+        code, _, err = run_command(
+            ["git", "fetch", "--prune", "--tags", "--force", "origin",
+             "+refs/heads/*:refs/heads/*"],
+            cwd=str(repo_dir), env=GIT_NETWORK_ENV)
         if code != 0:
             log_warn(f"Failed to fetch drupal.org/{module}: {err}")
             return None
-        code, head_ref, _ = run_command(["git", "symbolic-ref", "HEAD"], cwd=str(repo_dir))
-        if code == 0:
-            run_command(["git", "update-ref", head_ref.strip(), "FETCH_HEAD"], cwd=str(repo_dir))
     else:
         log_info(f"Cloning drupal.org/{module}...")
-        code, _, err = run_command(["git", "clone", "--bare", repo_url, str(repo_dir)])
+        # Partial clone: commit/tree history only, blobs are fetched on
+        # demand when git archive materializes a snapshot - cuts the
+        # initial transfer by an order of magnitude on old, asset-heavy repos.
+        code, _, err = run_command(
+            ["git", "clone", "--bare", "--filter=blob:none", repo_url, str(repo_dir)],
+            env=GIT_NETWORK_ENV)
         if code != 0:
             log_warn(f"Failed to clone drupal.org/{module}: {err}")
             return None
@@ -114,53 +186,198 @@ def setup_repo(repos_dir: Path, org: str, repo: str) -> Optional[Path]:
 
     if repo_dir.exists():
         log_info(f"Updating {org}/{repo}...")
-        code, _, err = run_command(["git", "fetch", "origin", "--tags"], cwd=str(repo_dir))
+        # One fetch with an explicit refspec moves refs/heads/* forward in
+        # the bare repo directly - no symbolic-ref/update-ref follow-up,
+        # and --prune/--force keep deleted or rewritten branches honest.
+        code, _, err = run_command(
+            ["git", "fetch", "--prune", "--tags", "--force", "origin",
+             "+refs/heads/*:refs/heads/*"],
+            cwd=str(repo_dir), env=GIT_NETWORK_ENV)
         if code != 0:
             log_warn(f"Failed to fetch {org}/{repo}: {err}")
             return None
-        code, head_ref, _ = run_command(["git", "symbolic-ref", "HEAD"], cwd=str(repo_dir))
-        if code == 0:
-            run_command(["git", "update-ref", head_ref.strip(), "FETCH_HEAD"], cwd=str(repo_dir))
     else:
         log_info(f"Cloning {org}/{repo}...")
-        code, _, err = run_command(["git", "clone", "--bare", repo_url, str(repo_dir)])
+        # Partial clone: commit/tree history only, blobs are fetched on
+        # demand when git archive materializes a snapshot - cuts the
+        # initial transfer by an order of magnitude on old, asset-heavy repos.
+        code, _, err = run_command(
+            ["git", "clone", "--bare", "--filter=blob:none", repo_url, str(repo_dir)],
+            env=GIT_NETWORK_ENV)
         if code != 0:
             log_warn(f"Failed to clone {org}/{repo}: {err}")
             return None
     return repo_dir
 
 
-def get_commit_for_date(repo_dir: Path, target_date: str) -> Optional[str]:
-    """Get the commit hash closest to the target date."""
-    code, stdout, _ = run_command(
-        ["git", "rev-list", "-1", f"--before={target_date}T23:59:59", "HEAD"],
-        cwd=str(repo_dir)
-    )
-    if code == 0 and stdout.strip():
-        return stdout.strip()
-    return None
+# Per-repo commit timelines, loaded once and bisected for every snapshot
+# date instead of forking git rev-list per (repo, snapshot) pair. The
+# tree hash rides along because %T is free in the same git log and it is
+# what actually determines analysis results.
+_commit_timelines: dict[Path, tuple[list[int], list[str], list[str]]] = {}
+
+
+def load_commit_timeline(repo_dir: Path) -> tuple[list[int], list[str], list[str]]:
+    """Load (sorted timestamps, commit hashes, tree hashes), cached per process."""
+    timeline = _commit_timelines.get(repo_dir)
+    if timeline is None:
+        rows = []
+        try:
+            for line in run_command_stream(
+                    ["git", "log", "--pretty=format:%ct %H %T"], cwd=str(repo_dir)):
+                parts = line.split()
+                if len(parts) == 3 and parts[0].isdigit():
+                    rows.append((int(parts[0]), parts[1], parts[2]))
+        except (OSError, subprocess.CalledProcessError) as e:
+            log_debug(f"git log failed for {repo_dir.name}: {e}")
+            rows = []
+        rows.sort()
+        timeline = ([t for t, _, _ in rows], [h for _, h, _ in rows],
+                    [tr for _, _, tr in rows])
+        _commit_timelines[repo_dir] = timeline
+    return timeline
+
+
+def get_commit_for_date(repo_dir: Path, target_date: str) -> Optional[tuple[str, str]]:
+    """Get the (commit hash, tree hash) closest to the target date."""
+    times, hashes, trees = load_commit_timeline(repo_dir)
+    if not times:
+        return None
+    cutoff = datetime.strptime(target_date, "%Y-%m-%d").replace(
+        hour=23, minute=59, second=59)
+    index = bisect_right(times, int(cutoff.timestamp()))
+    if index == 0:
+        return None
+    return hashes[index - 1], trees[index - 1]
 
 
-def get_commits_per_year(repo_dirs: list[Path]) -> list[dict]:
-    """Count commits per year from git history across all repos."""
-    year_counts = {}
+# Full parsed commit history per repo, loaded with a single git log and
+# shared by the yearly, monthly and recent-commit statistics.
+_commit_histories: dict[Path, list[dict]] = {}
 
-    for repo_dir in repo_dirs:
+# Where per-repo history is persisted between runs (set by main). History
+# only ever appends, so re-runs read the JSONL cache and ask git just for
+# commits newer than the cached tip.
+_history_cache_dir: Optional[Path] = None
+
+
+def _parse_history_lines(lines) -> list[dict]:
+    """Parse "%H:%cs:%s" git log lines into history records."""
+    records = []
+    for line in lines:
+        parts = line.rstrip('\n').split(':', 2)
+        if len(parts) == 3:
+            records.append({
+                'hash': parts[0],
+                'date': parts[1],
+                'subject': parts[2],
+            })
+    return records
+
+
+def _read_history_cache(cache_file: Path) -> list[dict]:
+    """Read cached history records (oldest first), or [] if absent/corrupt."""
+    if not cache_file.exists():
+        return []
+    try:
+        with open(cache_file, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except (OSError, json.JSONDecodeError) as e:
+        log_debug(f"Discarding unreadable history cache {cache_file}: {e}")
+        return []
+
+
+def _write_history_cache(cache_file: Path, records: list[dict], append: bool = False):
+    """Persist history records as JSONL, one commit per line."""
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_file, "a" if append else "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        log_debug(f"Failed to write history cache {cache_file}: {e}")
+
+
+def load_commit_history(repo_dir: Path) -> list[dict]:
+    """Parse a repo's full commit history once, cached per process and,
+    when a cache dir is configured, on disk across runs.
+
+    Each record carries hash, committer date (YYYY-MM-DD) and subject,
+    oldest first. Deliberately no --shortstat: that would make git diff
+    every commit in history, and only the bounded recent-commits list
+    needs line counts.
+    """
+    history = _commit_histories.get(repo_dir)
+    if history is not None:
+        return history
+
+    cache_file = None
+    if _history_cache_dir is not None:
+        cache_file = _history_cache_dir / f"{repo_dir.name}.commits.jsonl"
+
+    history = _read_history_cache(cache_file) if cache_file else []
+    if history:
+        # Ask git only for commits newer than the cached tip. This fails -
+        # and we fall through to a full reload - when the tip no longer
+        # exists, i.e. the repo was force-pushed.
         code, stdout, _ = run_command(
-            ["git", "log", "--pretty=format:%ad", "--date=format:%Y"],
+            ["git", "log", f"{history[-1]['hash']}..HEAD", "--pretty=format:%H:%cs:%s"],
             cwd=str(repo_dir)
         )
-        if code != 0 or not stdout.strip():
-            continue
-
-        for line in stdout.strip().split('\n'):
-            year = line.strip()
-            if year:
-                year_counts[year] = year_counts.get(year, 0) + 1
+        if code == 0:
+            new_records = _parse_history_lines(stdout.splitlines())[::-1]  # oldest first
+            if new_records and cache_file:
+                _write_history_cache(cache_file, new_records, append=True)
+            history.extend(new_records)
+            _commit_histories[repo_dir] = history
+            return history
+        log_debug(f"History cache stale for {repo_dir.name}; reloading")
+        history = []
 
-    result = [{"year": int(year), "commits": count} for year, count in year_counts.items()]
-    result.sort(key=lambda x: x["year"])
-    return result
+    try:
+        history = _parse_history_lines(run_command_stream(
+            ["git", "log", "--pretty=format:%H:%cs:%s"], cwd=str(repo_dir)))[::-1]
+    except (OSError, subprocess.CalledProcessError) as e:
+        log_debug(f"git log failed for {repo_dir.name}: {e}")
+        history = []
+    if history and cache_file:
+        _write_history_cache(cache_file, history)
+
+    _commit_histories[repo_dir] = history
+    return history
+
+
+def get_commits_per_year(commits_monthly: list[dict]) -> list[dict]:
+    """Aggregate yearly commit totals from the monthly buckets."""
+    year_counts = Counter()
+    for month in commits_monthly:
+        year_counts[int(month["date"][:4])] += month["total"]
+
+    return [{"year": year, "commits": count}
+            for year, count in sorted(year_counts.items())]
+
+
+# Conventional commits pattern: type(optional-scope)!: description.
+# The regex recognizes the shape only - any word prefix - and the flat
+# dict maps known types to categories, so matching never backtracks
+# through an alternation and adding a type is a one-line dict edit.
+_CONVENTIONAL_RE = re.compile(r'^([a-z]+)(?:\([^)]+\))?!?:')
+_COMMIT_TYPES = {
+    "fix": "Bug", "bugfix": "Bug", "bug": "Bug", "hotfix": "Bug",
+    "feat": "Feature", "feature": "Feature",
+    "build": "Maintenance", "chore": "Maintenance", "ci": "Maintenance",
+    "docs": "Maintenance", "style": "Maintenance", "refactor": "Maintenance",
+    "perf": "Maintenance", "test": "Maintenance", "task": "Maintenance",
+    "revert": "Maintenance",
+}
+
+# Drupal-style issue references: "Issue #1234567"
+_ISSUE_RE = re.compile(r'^issue\s*#?\d+')
+
+# git --shortstat summary line; either count may be absent.
+# e.g. " 3 files changed, 10 insertions(+), 2 deletions(-)"
+_SHORTSTAT_RE = re.compile(
+    r'changed(?:, (\d+) insertions?\(\+\))?(?:, (\d+) deletions?\(-\))?')
 
 
 def classify_commit(subject: str) -> str:
@@ -169,26 +386,21 @@ def classify_commit(subject: str) -> str:
     Format: <type>[optional scope][!]: <description>
     See: https://www.conventionalcommits.org/en/v1.0.0/
     """
-    subject = subject.strip().lower()
-
-    # Conventional commits pattern: type(optional-scope)!: description
-    # Types that indicate bugs
-    bug_pattern = r'^(fix|bugfix|bug|hotfix)(\([^)]+\))?!?:'
-    if re.match(bug_pattern, subject):
-        return "Bug"
-
-    # Types that indicate features
-    feature_pattern = r'^(feat|feature)(\([^)]+\))?!?:'
-    if re.match(feature_pattern, subject):
-        return "Feature"
-
-    # Types that indicate maintenance/tasks
-    maintenance_pattern = r'^(build|chore|ci|docs|style|refactor|perf|test|task|revert)(\([^)]+\))?!?:'
-    if re.match(maintenance_pattern, subject):
-        return "Maintenance"
+    # Only the leading characters can decide the category, and prefixes
+    # like "fix:" / "chore(deps):" repeat heavily - truncating before the
+    # lru_cache keeps arbitrary subject tails from blowing out the cache.
+    return _classify_prefix(subject.strip().lower()[:40])
+
+
+@functools.lru_cache(maxsize=8192)
+def _classify_prefix(subject: str) -> str:
+    match = _CONVENTIONAL_RE.match(subject)
+    if match:
+        category = _COMMIT_TYPES.get(match.group(1))
+        if category:
+            return category
 
-    # Drupal-style issue references: "Issue #1234567"
-    if re.match(r'^issue\s*#?\d+', subject):
+    if _ISSUE_RE.match(subject):
         return "Maintenance"
 
     # Merge commits
@@ -200,68 +412,98 @@ def classify_commit(subject: str) -> str:
 
 def get_commits_per_month(repo_dirs: list[Path]) -> list[dict]:
     """Count commits per month from git history across all repos."""
-    month_counts = {}
+    # Flat Counter keyed by (month, category): one hash per update instead
+    # of the dict-of-dicts membership check plus nested lookup per commit.
+    counts = Counter()
 
     for repo_dir in repo_dirs:
-        code, stdout, _ = run_command(
-            ["git", "log", "--pretty=format:%ad|%s", "--date=format:%Y-%m"],
-            cwd=str(repo_dir)
-        )
-        if code != 0 or not stdout.strip():
-            continue
-
-        for line in stdout.strip().split('\n'):
-            if '|' not in line:
-                continue
-            date, subject = line.split('|', 1)
-            date = date.strip()
-
-            if date not in month_counts:
-                month_counts[date] = {"total": 0, "features": 0, "bugs": 0, "maintenance": 0, "unknown": 0}
-
-            month_counts[date]["total"] += 1
-            commit_type = classify_commit(subject)
-            if commit_type == "Bug":
-                month_counts[date]["bugs"] += 1
-            elif commit_type == "Feature":
-                month_counts[date]["features"] += 1
-            elif commit_type == "Maintenance":
-                month_counts[date]["maintenance"] += 1
-            else:
-                month_counts[date]["unknown"] += 1
-
-    result = [{"date": date, **counts} for date, counts in month_counts.items()]
-    result.sort(key=lambda x: x["date"])
+        for record in load_commit_history(repo_dir):
+            date = record['date'][:7]
+            counts[(date, "total")] += 1
+            counts[(date, classify_commit(record['subject']))] += 1
+
+    result = [
+        {
+            "date": date,
+            "total": counts[(date, "total")],
+            "features": counts[(date, "Feature")],
+            "bugs": counts[(date, "Bug")],
+            "maintenance": counts[(date, "Maintenance")],
+            "unknown": counts[(date, "Unknown")],
+        }
+        for date in sorted({date for date, _ in counts})
+    ]
     return result
 
 
+def _present_pathspecs(repo_dir: Path, commit: str) -> list[str]:
+    """Return the EXPORT_PATHSPECS that match at least one file at commit.
+
+    git archive aborts the whole export if any single pathspec matches
+    nothing at that commit, so the spec list has to be narrowed per
+    commit. ls-tree only reads tree objects, so this stays cheap even in
+    blob-filtered partial clones, and the scan stops once every spec has
+    been seen.
+    """
+    wanted = {spec[1:]: spec for spec in EXPORT_PATHSPECS}  # ".php" -> "*.php"
+    present = []
+    try:
+        for line in run_command_stream(
+                ["git", "ls-tree", "-r", "--name-only", commit], cwd=str(repo_dir)):
+            dot = line.rfind(".")
+            spec = wanted.pop(line[dot:].rstrip("\n"), None) if dot != -1 else None
+            if spec:
+                present.append(spec)
+                if not wanted:
+                    break
+    except (OSError, subprocess.CalledProcessError) as e:
+        log_debug(f"ls-tree failed for {commit[:8]} in {repo_dir.name}: {e}")
+        return []
+    return present
+
+
 def export_version(repo_dir: Path, commit: str, work_dir: Path, subdir: str = "") -> bool:
     """Export a specific version of a repo to work directory."""
     target_dir = work_dir / subdir if subdir else work_dir
     if target_dir.exists():
-        shutil.rmtree(target_dir)
+        remove_tree(target_dir)
     target_dir.mkdir(parents=True)
 
+    pathspecs = _present_pathspecs(repo_dir, commit)
+    if not pathspecs:
+        log_debug(f"No exportable files at {commit[:8]} in {repo_dir.name}")
+        return False
+
     try:
         git_proc = subprocess.Popen(
-            ["git", "archive", commit],
+            ["git", "archive", "--format=tar", commit, "--"] + pathspecs,
             cwd=str(repo_dir),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE
         )
-        tar_proc = subprocess.Popen(
-            ["tar", "-x", "-C", str(target_dir)],
-            stdin=git_proc.stdout,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        git_proc.stdout.close()
-        tar_proc.communicate(timeout=300)
-        git_proc.wait()
-        return tar_proc.returncode == 0 and git_proc.returncode == 0
+    except OSError as e:
+        log_warn(f"Failed to archive {commit[:8]} from {repo_dir.name}: {e}")
+        return False
+
+    try:
+        # Stream-extract in-process: no external tar subprocess, and the
+        # "r|" mode reads the pipe sequentially without buffering the archive.
+        with tarfile.open(fileobj=git_proc.stdout, mode="r|") as tar:
+            tar.extractall(target_dir)
     except Exception as e:
-        log_warn(f"Failed to archive {commit[:8]}: {e}")
+        # A truncated archive usually means git itself failed (e.g. a
+        # promisor blob fetch); surface git's stderr, not tarfile's guess.
+        _, err = git_proc.communicate()
+        detail = err.decode(errors="replace").strip() or str(e)
+        log_warn(f"Failed to archive {commit[:8]} from {repo_dir.name}: {detail}")
+        return False
+
+    _, err = git_proc.communicate(timeout=300)
+    if git_proc.returncode != 0:
+        detail = err.decode(errors="replace").strip()
+        log_warn(f"Failed to archive {commit[:8]} from {repo_dir.name}: {detail}")
         return False
+    return True
 
 
 def get_recent_commits(repo_dirs: list[Path], days: int = 365) -> list[dict]:
@@ -270,123 +512,279 @@ def get_recent_commits(repo_dirs: list[Path], days: int = 365) -> list[dict]:
 
     for repo_dir in repo_dirs:
         repo_name = repo_dir.name
+        # This is the only consumer that needs line counts, so the diff
+        # cost is bounded here: at most 200 commits per repo can survive
+        # the global top-200 cut, and rename detection is skipped.
+        # NUL before each header plus unit separators between fields gives
+        # unambiguous record boundaries: one C-level split replaces the
+        # line-by-line state machine, and subjects may contain anything.
         code, stdout, _ = run_command(
-            ["git", "log", f"--since={days} days ago", "--pretty=format:COMMIT:%H:%cs:%s", "--shortstat"],
+            ["git", "log", f"--since={days} days ago", "-n", "200",
+             "--no-renames", "--pretty=format:%x00%H%x1f%cs%x1f%s%x1f",
+             "--shortstat"],
             cwd=str(repo_dir)
         )
         if code != 0:
             continue
 
-        current_hash = None
-        current_msg = None
-        current_date = None
-
-        for line in stdout.split('\n'):
-            line = line.strip()
-            if line.startswith('COMMIT:'):
-                parts = line.split(':', 3)
-                if len(parts) >= 4:
-                    current_hash = parts[1]
-                    current_date = parts[2]
-                    current_msg = parts[3][:80]
-            elif 'changed' in line and current_hash:
-                insertions = deletions = 0
-                match_ins = re.search(r'(\d+) insertion', line)
-                match_del = re.search(r'(\d+) deletion', line)
-                if match_ins:
-                    insertions = int(match_ins.group(1))
-                if match_del:
-                    deletions = int(match_del.group(1))
-                total = insertions + deletions
-                try:
-                    dt = datetime.strptime(current_date, "%Y-%m-%d")
-                    formatted_date = dt.strftime("%b %d, %Y")
-                except ValueError:
-                    formatted_date = current_date
-                commits.append({
-                    'hash': current_hash,
-                    'message': current_msg,
-                    'date': formatted_date,
-                    'sort_date': current_date,
-                    'lines': total,
-                    'type': classify_commit(current_msg),
-                    'repo': repo_name
-                })
-                current_hash = None
-
-    commits = sorted(commits, key=lambda x: x['sort_date'], reverse=True)
-    for c in commits:
+        for record in stdout.split("\0"):
+            fields = record.split("\x1f", 3)
+            if len(fields) != 4:
+                continue
+            commit_hash, commit_date, subject, stat_text = fields
+            # Merge and empty commits carry no shortstat line; skip them
+            # like the previous parser did.
+            match = _SHORTSTAT_RE.search(stat_text)
+            if not match:
+                continue
+            message = subject[:80]
+            total = int(match.group(1) or 0) + int(match.group(2) or 0)
+            try:
+                # fromisoformat is considerably faster than strptime here
+                dt = datetime.fromisoformat(commit_date)
+                formatted_date = dt.strftime("%b %d, %Y")
+            except ValueError:
+                formatted_date = commit_date
+            commits.append({
+                'hash': commit_hash,
+                'message': message,
+                'date': formatted_date,
+                'sort_date': commit_date,
+                'lines': total,
+                'type': classify_commit(message),
+                'repo': repo_name
+            })
+
+    # Selecting the newest 200 with a bounded heap is O(n log 200) and
+    # never materializes a fully sorted copy of every repo's year.
+    top = heapq.nlargest(200, commits, key=lambda x: x['sort_date'])
+    for c in top:
         del c['sort_date']
-    return commits[:200]  # Limit to 200 most recent
+    return top
+
+
+# One persistent PHP analyzer per (process, mode): it reads directory
+# paths on stdin and answers with one JSON line each, so the interpreter
+# and Composer autoloader boot once per pool worker instead of once per
+# analyzed tree.
+_php_workers: dict[tuple[str, bool], subprocess.Popen] = {}
+
+PHP_ANALYSIS_TIMEOUT = 600  # seconds per analyzed tree
+
+
+def _get_php_worker(php_script: Path, per_subdir: bool) -> subprocess.Popen:
+    """Return the live batch-mode PHP worker, (re)starting it if needed."""
+    key = (str(php_script), per_subdir)
+    proc = _php_workers.get(key)
+    if proc is None or proc.poll() is not None:
+        # CLI PHP runs with opcache off by default, so PhpParser and the
+        # analyzer would stay interpreted for the whole run. Opcache plus
+        # the tracing JIT speeds up the AST-heavy hot loops, and the file
+        # cache lets every pool worker reuse the compiled bytecode.
+        opcache_dir = Path(os.environ.get(
+            "XDG_CACHE_HOME", Path.home() / ".cache")) / "ymcaws-metrics-opcache"
+        opcache_dir.mkdir(parents=True, exist_ok=True)
+        cmd = ["php", "-d", "memory_limit=2G",
+               "-d", "opcache.enable_cli=1",
+               "-d", "opcache.jit=tracing",
+               "-d", "opcache.jit_buffer_size=64M",
+               "-d", f"opcache.file_cache={opcache_dir}",
+               str(php_script), "--batch"]
+        if per_subdir:
+            cmd.append("--per-subdir")
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None if os.environ.get("DEBUG") else subprocess.DEVNULL,
+            text=True,
+        )
+        _php_workers[key] = proc
+    return proc
 
 
-def analyze_directory(work_dir: Path, php_script: Path) -> Optional[dict]:
-    """Analyze a directory using drupalisms.php."""
-    # Find PHP files to analyze
-    php_files = list(work_dir.rglob("*.php")) + list(work_dir.rglob("*.module")) + list(work_dir.rglob("*.inc"))
-    if not php_files:
+def _has_php_files(root: Path) -> bool:
+    """Return True as soon as one PHP source file is found under root.
+
+    A hand-rolled scandir walk rather than os.walk: DirEntry.is_dir()
+    answers from the readdir d_type, no per-entry stat or Path object is
+    allocated, and the walk aborts mid-directory on the first hit.
+    """
+    stack = [str(root)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith((".php", ".module", ".inc")):
+                        return True
+        except OSError:
+            continue
+    return False
+
+
+def analyze_directory(work_dir: Path, php_script: Path,
+                      per_subdir: bool = False) -> Optional[dict]:
+    """Analyze a directory using drupalisms.php.
+
+    With per_subdir=True the PHP worker also returns a per-top-level-
+    subdirectory breakdown under the "perSubdir" key.
+    """
+    # Cheap existence probe that stops at the first match - drupalisms.php
+    # does its own full scan, so all we need to know here is whether there
+    # is anything to analyze at all.
+    if not _has_php_files(work_dir):
         log_debug(f"No PHP files found in {work_dir}")
         return None
 
-    log_debug(f"Found {len(php_files)} PHP files to analyze")
+    # The worker answers one request with one line, but with per_subdir
+    # that single answer covers the aggregate pass plus a pass over every
+    # top-level subdirectory - budget each analyzed tree separately, like
+    # the old one-process-per-invocation timeout did.
+    timeout = PHP_ANALYSIS_TIMEOUT
+    if per_subdir:
+        subdirs = sum(1 for entry in os.scandir(work_dir)
+                      if entry.is_dir(follow_symlinks=False))
+        timeout = PHP_ANALYSIS_TIMEOUT * (1 + subdirs)
 
     try:
-        result = subprocess.run(
-            ["php", "-d", "memory_limit=2G", str(php_script), str(work_dir)],
-            capture_output=True,
-            text=True,
-            timeout=600
-        )
-        if result.returncode != 0:
-            log_debug(f"PHP analysis failed: {result.stderr[:500]}")
+        proc = _get_php_worker(php_script, per_subdir)
+        proc.stdin.write(f"{work_dir}\n")
+        proc.stdin.flush()
+
+        if os.name == "posix" and not select.select(
+                [proc.stdout], [], [], timeout)[0]:
+            log_warn(f"PHP analysis timed out for {work_dir}")
+            proc.kill()
             return None
 
-        if not result.stdout.strip():
-            log_debug("PHP analysis returned empty output")
+        line = proc.stdout.readline()
+        if not line.strip():
+            log_debug("PHP analyzer produced no result (worker exited?)")
             return None
-
-        data = json.loads(result.stdout)
-        log_debug(f"PHP analysis returned data with keys: {list(data.keys())}")
-        return data
-    except json.JSONDecodeError as e:
-        log_debug(f"JSON decode error: {e}")
-        return None
+        data = json.loads(line)
     except Exception as e:
         log_debug(f"Exception during analysis: {e}")
         return None
 
+    if data.get("error"):
+        log_debug(f"PHP analysis failed: {data['error']}")
+        return None
+
+    log_debug(f"PHP analysis returned data with keys: {list(data.keys())}")
+    return data
+
+
+def _cache_key(entries: list[str]) -> str:
+    """Stable key for a set of repo@commit entries."""
+    return hashlib.sha256("|".join(sorted(entries)).encode()).hexdigest()
+
+
+def _cache_load(cache_file: Path) -> Optional[dict]:
+    """Read a cached analysis result, or None if absent/corrupt."""
+    if not cache_file.exists():
+        return None
+    try:
+        with open(cache_file, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        log_debug(f"Ignoring unreadable cache {cache_file}: {e}")
+        return None
+
+
+def _cache_store(cache_file: Path, data: dict):
+    """Persist an analysis result for reuse by later runs.
 
-def analyze_version(repo_dirs: list[Path], year_month: str, output_dir: Path,
+    Written via a per-process temp file and os.replace so concurrent pool
+    workers storing the same key never interleave partial writes.
+    """
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        log_debug(f"Failed to write cache {cache_file}: {e}")
+        tmp_file.unlink(missing_ok=True)
+
+
+def analyze_version(repo_dirs: list[Path], year_month: str, work_dir: Path,
                     php_script: Path, current: int = 0, total: int = 0,
-                    collect_per_repo: bool = False) -> Optional[dict]:
-    """Analyze a specific point in time across all repos."""
-    work_dir = output_dir / "work"
+                    collect_per_repo: bool = False,
+                    use_cache: bool = True,
+                    cache_dir: Optional[Path] = None) -> Optional[dict]:
+    """Analyze a specific point in time across all repos.
+
+    Each call owns its work_dir exclusively (and removes it when done), so
+    snapshots can run in parallel worker processes without colliding. The
+    cache_dir should live on durable storage even when work_dir is tmpfs.
+    """
     if work_dir.exists():
-        shutil.rmtree(work_dir)
+        remove_tree(work_dir)
     work_dir.mkdir(parents=True)
 
+    if cache_dir is None:
+        cache_dir = work_dir.parent / "cache"
+
+    try:
+        return _analyze_version_in_dir(
+            repo_dirs, year_month, work_dir, php_script, current, total,
+            collect_per_repo, use_cache, cache_dir)
+    finally:
+        if work_dir.exists():
+            remove_tree(work_dir)
+
+
+def _analyze_version_in_dir(repo_dirs: list[Path], year_month: str, work_dir: Path,
+                            php_script: Path, current: int, total: int,
+                            collect_per_repo: bool, use_cache: bool,
+                            cache_dir: Path) -> Optional[dict]:
     progress = f" [{current}/{total}]" if total else ""
     log_info(f"Analyzing {year_month}{progress}")
 
     target_date = f"{year_month}-15"  # Mid-month
-    exported_any = False
-    exported_repos = []
 
+    # Resolve commits first (cheap), then export concurrently - each repo
+    # extracts into its own work_dir subdirectory, so there is no contention.
+    tasks = []
+    tree_ids = []
     for repo_dir in repo_dirs:
-        commit = get_commit_for_date(repo_dir, target_date)
-        if commit:
-            repo_name = repo_dir.name
-            if export_version(repo_dir, commit, work_dir, repo_name):
-                exported_any = True
-                exported_repos.append(repo_name)
-
-    if not exported_any:
+        resolved = get_commit_for_date(repo_dir, target_date)
+        if resolved:
+            commit, tree = resolved
+            tasks.append((repo_dir, commit, repo_dir.name))
+            tree_ids.append(f"{repo_dir.name}@{tree}")
+
+    # The set of exported trees fully determines the analysis result, so
+    # the cache is keyed on tree hashes rather than commit hashes: commits
+    # that only touch metadata (merges, amended messages, doc-only repos
+    # between snapshots) still map to the same tree and reuse the cached
+    # JSON, skipping both the export and the PHP pass.
+    snapshot_cache = cache_dir / f"{_cache_key(tree_ids)}.json"
+    if use_cache and tasks:
+        cached = _cache_load(snapshot_cache)
+        if cached and (not collect_per_repo or "perRepo" in cached):
+            log_info(f"Using cached analysis for {year_month}")
+            cached["date"] = year_month
+            return cached
+
+    exported_repos = []
+    if tasks:
+        workers = min(len(tasks), (os.cpu_count() or 1) * 2)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                lambda t: export_version(t[0], t[1], work_dir, t[2]), tasks)
+            exported_repos = [t[2] for t, ok in zip(tasks, results) if ok]
+
+    if not exported_repos:
         log_warn(f"No repos exported for {year_month}")
         return None
 
     log_debug(f"Exported {len(exported_repos)} repos for {year_month}")
 
-    data = analyze_directory(work_dir, php_script)
+    data = analyze_directory(work_dir, php_script, per_subdir=collect_per_repo)
     if not data:
         log_warn(f"Analysis returned no data for {year_month}")
         return None
@@ -402,35 +800,85 @@ def analyze_version(repo_dirs: list[Path], year_month: str, output_dir: Path,
         "hotspots": data.get("hotspots", []),
     }
 
-    # Collect per-repo stats for current snapshot
+    # Collect per-repo stats for current snapshot - all delivered by the
+    # same PHP invocation as the aggregate via --per-subdir.
     if collect_per_repo:
+        per_subdir = data.get("perSubdir", {})
         per_repo = []
         for repo_name in exported_repos:
-            repo_work_dir = work_dir / repo_name
-            if repo_work_dir.exists():
-                repo_data = analyze_directory(repo_work_dir, php_script)
-                if repo_data:
-                    # Clean up repo name for display
-                    display_name = repo_name
-                    for prefix in ["YCloudYUSA_", "open-y-subprojects_", "drupal_"]:
-                        if display_name.startswith(prefix):
-                            display_name = display_name[len(prefix):]
-                            break
-                    per_repo.append({
-                        "name": display_name,
-                        "loc": repo_data.get("production", {}).get("loc", 0),
-                        "ccn": repo_data.get("production", {}).get("ccn", {}).get("avg", 0),
-                        "mi": repo_data.get("production", {}).get("mi", {}).get("avg", 0),
-                        "antipatterns": sum(repo_data.get("antipatterns", {}).values()),
-                    })
+            repo_data = per_subdir.get(repo_name)
+            if not repo_data:
+                continue
+            # Clean up repo name for display
+            display_name = repo_name
+            for prefix in ["YCloudYUSA_", "open-y-subprojects_", "drupal_"]:
+                if display_name.startswith(prefix):
+                    display_name = display_name[len(prefix):]
+                    break
+            per_repo.append({
+                "name": display_name,
+                "loc": repo_data.get("production", {}).get("loc", 0),
+                "ccn": repo_data.get("production", {}).get("ccn", {}).get("avg", 0),
+                "mi": repo_data.get("production", {}).get("mi", {}).get("avg", 0),
+                "antipatterns": sum(repo_data.get("antipatterns", {}).values()),
+            })
         # Sort by LOC descending
         per_repo.sort(key=lambda x: x["loc"], reverse=True)
         result["perRepo"] = per_repo
         log_info(f"Collected stats for {len(per_repo)} individual repos")
 
+    # Persist only complete results: the key covers every resolved tree,
+    # so a run where some exports failed (promisor blob fetch hiccup)
+    # must not be served as authoritative for the full set later.
+    if use_cache and tasks and len(exported_repos) == len(tasks):
+        _cache_store(snapshot_cache, result)
+
     return result
 
 
+def write_data_json(data_file: Path, data: dict, ndjson_path: Path,
+                    snapshot_offsets: dict[str, int]):
+    """Write data.json, splicing snapshots straight from the NDJSON sidecar.
+
+    Snapshots are the bulk of the payload and are already serialized, one
+    line each, in the sidecar - copying those lines byte-for-byte means
+    the full snapshot list is never materialized as Python objects or as
+    one giant output string.
+    """
+    with open(data_file, "w", encoding="utf-8") as out, \
+            open(ndjson_path, "rb") as nd:
+        out.write("{")
+        for key, value in data.items():
+            json.dump(key, out)
+            out.write(":")
+            json.dump(value, out, ensure_ascii=False)
+            out.write(",")
+        out.write('"snapshots":[')
+        for i, date in enumerate(sorted(snapshot_offsets)):
+            if i:
+                out.write(",")
+            nd.seek(snapshot_offsets[date])
+            out.write(nd.readline().decode("utf-8").rstrip("\n"))
+        out.write("]}")
+
+
+def find_scratch_root(output_dir: Path) -> Path:
+    """Pick where per-snapshot work directories live.
+
+    Snapshot trees are written, analyzed and deleted within seconds, so a
+    tmpfs keeps that churn off the disk entirely. WORK_ROOT overrides the
+    choice; otherwise /dev/shm is used when writable, falling back to the
+    output directory.
+    """
+    env_root = os.environ.get("WORK_ROOT")
+    if env_root:
+        return Path(env_root)
+    shm = Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        return shm / "ymcaws-metrics"
+    return output_dir
+
+
 def find_project_dir() -> Path:
     """Find the project directory regardless of where script is run from."""
     # Try relative to script location first
@@ -449,7 +897,21 @@ def find_project_dir() -> Path:
     sys.exit(1)
 
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Collect YMCA WS distribution metrics across historical snapshots.")
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Ignore cached analysis results and re-run every PHP analysis")
+    return parser.parse_args()
+
+
 def main():
+    global _history_cache_dir
+
+    args = parse_args()
+    use_cache = not args.no_cache
+
     project_dir = find_project_dir()
     log_info(f"Project directory: {project_dir}")
 
@@ -481,20 +943,18 @@ def main():
     total_repos = len(ymca_github_repos) + len(drupal_org_modules)
     log_info(f"Found {total_repos} YMCA repos to analyze ({len(ymca_github_repos)} GitHub + {len(drupal_org_modules)} drupal.org)")
 
-    # Clone/update GitHub repos
-    repo_dirs = []
-    for repo_config in ymca_github_repos:
-        org = repo_config["org"]
-        repo = repo_config["repo"]
-        repo_dir = setup_repo(repos_dir, org, repo)
-        if repo_dir:
-            repo_dirs.append(repo_dir)
-
-    # Clone/update drupal.org repos
-    for module in drupal_org_modules:
-        repo_dir = setup_drupal_org_repo(repos_dir, module)
-        if repo_dir:
-            repo_dirs.append(repo_dir)
+    # Clone/update all repos concurrently - each task is an independent
+    # network-bound git subprocess, so threads overlap the round-trips.
+    futures = []
+    with ThreadPoolExecutor(max_workers=CLONE_WORKERS) as executor:
+        for repo_config in ymca_github_repos:
+            futures.append(executor.submit(
+                setup_repo, repos_dir, repo_config["org"], repo_config["repo"]))
+        for module in drupal_org_modules:
+            futures.append(executor.submit(setup_drupal_org_repo, repos_dir, module))
+        results = [f.result() for f in futures]
+
+    repo_dirs = [r for r in results if r]
 
     if not repo_dirs:
         log_error("No repos available for analysis")
@@ -502,79 +962,113 @@ def main():
 
     log_info(f"Successfully set up {len(repo_dirs)} repos")
 
-    # Build list of semi-annual snapshots
+    # Build list of semi-annual snapshots. Working in months-since-year-0
+    # replaces the wrap-on-December branching with plain arithmetic and
+    # sizes the list up front.
     today = datetime.now()
-    target = DISTRIBUTION_START_DATE.replace(day=1)
-    snapshot_dates = []
-    while target <= today:
-        snapshot_dates.append(target)
-        new_month = target.month + 6
-        if new_month > 12:
-            target = target.replace(year=target.year + 1, month=new_month - 12)
-        else:
-            target = target.replace(month=new_month)
+    start_month = DISTRIBUTION_START_DATE.year * 12 + DISTRIBUTION_START_DATE.month - 1
+    span = (today.year * 12 + today.month - 1) - start_month
+    snapshot_dates = [
+        datetime((start_month + offset) // 12, (start_month + offset) % 12 + 1, 1)
+        for offset in range(0, span + 1, 6)
+    ]
 
     total = len(snapshot_dates)
     log_info(f"Analyzing {total} semi-annual snapshots")
 
-    snapshots = []
-    for i, target in enumerate(snapshot_dates, 1):
-        year_month = target.strftime("%Y-%m")
-        result = analyze_version(repo_dirs, year_month, output_dir, php_script, i, total)
-        if result:
-            snapshots.append(result)
-            log_debug(f"Snapshot {year_month} added, total snapshots: {len(snapshots)}")
-
-    # Analyze current HEAD with per-repo stats
-    log_info("Analyzing current HEAD with per-repo breakdown...")
-    current_date = datetime.now().strftime("%Y-%m")
-    if not snapshots or snapshots[-1]["date"] != current_date:
-        result = analyze_version(repo_dirs, current_date, output_dir, php_script,
-                                collect_per_repo=True)
-        if result:
-            snapshots.append(result)
-
-    # Cleanup work directory
-    work_dir = output_dir / "work"
-    if work_dir.exists():
-        shutil.rmtree(work_dir)
-
-    log_info(f"Collected {len(snapshots)} snapshots with data")
+    scratch_root = find_scratch_root(output_dir)
+    cache_dir = output_dir / "cache"
+    if use_cache:
+        _history_cache_dir = cache_dir
+    log_info(f"Using scratch root: {scratch_root}")
+
+    # Load every repo's commit timeline once before the pool spins up; on
+    # platforms that fork, the snapshot workers inherit the cache and
+    # resolve their dates without shelling out to git at all.
+    with ThreadPoolExecutor(max_workers=CLONE_WORKERS) as executor:
+        list(executor.map(load_commit_timeline, repo_dirs))
+
+    # Each finished snapshot is serialized to an NDJSON sidecar the moment
+    # it arrives and only its byte offset is kept, so peak memory stays at
+    # one snapshot regardless of run length - and a crash mid-run leaves
+    # the completed snapshots readable on disk.
+    ndjson_path = output_dir / "snapshots.ndjson"
+    snapshot_offsets: dict[str, int] = {}
+
+    with open(ndjson_path, "wb") as nd:
+        def record_snapshot(result: dict):
+            snapshot_offsets[result["date"]] = nd.tell()
+            nd.write(json.dumps(result, separators=(",", ":"),
+                                ensure_ascii=False).encode("utf-8") + b"\n")
+            log_debug(f"Snapshot {result['date']} recorded, "
+                      f"total snapshots: {len(snapshot_offsets)}")
+
+        # Snapshots are independent of each other, so fan them out across a
+        # process pool - each worker gets its own scratch directory.
+        snapshot_workers = min(total, os.cpu_count() or 1) or 1
+        with ProcessPoolExecutor(max_workers=snapshot_workers) as executor:
+            futures = []
+            for i, target in enumerate(snapshot_dates, 1):
+                year_month = target.strftime("%Y-%m")
+                futures.append(executor.submit(
+                    analyze_version, repo_dirs, year_month,
+                    scratch_root / f"work_{year_month}", php_script, i, total,
+                    use_cache=use_cache, cache_dir=cache_dir))
+            # Consume results as workers finish - slow snapshots (big trees,
+            # cold caches) don't hold up collection of the rest.
+            for future in as_completed(futures):
+                result = future.result()
+                if result:
+                    record_snapshot(result)
+
+        # Analyze current HEAD with per-repo stats
+        log_info("Analyzing current HEAD with per-repo breakdown...")
+        current_date = datetime.now().strftime("%Y-%m")
+        if current_date not in snapshot_offsets:
+            result = analyze_version(repo_dirs, current_date,
+                                     scratch_root / f"work_{current_date}", php_script,
+                                     collect_per_repo=True, use_cache=use_cache,
+                                     cache_dir=cache_dir)
+            if result:
+                record_snapshot(result)
+
+    log_info(f"Collected {len(snapshot_offsets)} snapshots with data")
+
+    # One git log per repo feeds all three commit statistics below;
+    # prefetch the histories concurrently so the stats passes hit the cache.
+    with ThreadPoolExecutor(max_workers=CLONE_WORKERS) as executor:
+        list(executor.map(load_commit_history, repo_dirs))
 
     # Get commit statistics
     commits = get_recent_commits(repo_dirs, days=365)
     log_info(f"Found {len(commits)} recent commits")
 
-    commitsPerYear = get_commits_per_year(repo_dirs)
-    log_info(f"Counted commits across {len(commitsPerYear)} years")
-
     commitsMonthly = get_commits_per_month(repo_dirs)
     log_info(f"Counted commits across {len(commitsMonthly)} months")
 
-    # Build final data structure
+    commitsPerYear = get_commits_per_year(commitsMonthly)
+    log_info(f"Counted commits across {len(commitsPerYear)} years")
+
+    # Build final data structure; snapshots are spliced in from the
+    # sidecar at write time rather than carried here.
     data = {
         "generated": datetime.now().isoformat(),
         "distribution": "YMCA Website Services",
         "repos_analyzed": [r.name for r in repo_dirs],
         "commitsMonthly": commitsMonthly,
-        "snapshots": snapshots,
         "commits": commits,
         "commitsPerYear": commitsPerYear,
     }
 
     # Verify data before saving
-    if not snapshots:
+    if not snapshot_offsets:
         log_error("No snapshots collected! Check if PHP analysis is working.")
         log_info("Saving partial data anyway...")
 
     # Save results
     try:
         log_info(f"Saving data to {data_file}...")
-        json_str = json.dumps(data, indent=2, ensure_ascii=False)
-        log_info(f"JSON serialization successful, {len(json_str)} characters")
-
-        with open(data_file, "w", encoding="utf-8") as f:
-            f.write(json_str)
+        write_data_json(data_file, data, ndjson_path, snapshot_offsets)
 
         # Verify the file was written
         actual_size = data_file.stat().st_size
@@ -583,7 +1077,7 @@ def main():
         if actual_size == 0:
             log_error("File was written but is empty!")
         elif actual_size < 1000:
-            log_warn(f"File seems small. Content preview: {json_str[:500]}")
+            log_warn(f"File seems small ({actual_size} bytes); check snapshot data")
 
     except Exception as e:
         log_error(f"Failed to save data: {e}")
@@ -591,7 +1085,7 @@ def main():
         traceback.print_exc()
         sys.exit(1)
 
-    log_info(f"Analysis complete! Processed {len(snapshots)} snapshots.")
+    log_info(f"Analysis complete! Processed {len(snapshot_offsets)} snapshots.")
 
 
 if __name__ == "__main__":
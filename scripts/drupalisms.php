@@ -21,7 +21,7 @@ ini_set('memory_limit', '512M');
  *    - Services: Distinct service types from *.services.yml
  *    - YAML formats: Distinct YAML extension point formats (routing, permissions, etc.)
  *
- * Usage: php drupalisms.php /path/to/drupal/core
+ * Usage: php drupalisms.php [--per-subdir] /path/to/drupal/core
  * Output: JSON with anti-patterns, surface area, and function-level metrics
  */
 
@@ -29,6 +29,7 @@ require_once __DIR__ . '/../vendor/autoload.php';
 
 use PhpParser\NodeTraverser;
 use PhpParser\NodeVisitorAbstract;
+use PhpParser\Parser;
 use PhpParser\ParserFactory;
 use PhpParser\Node;
 
@@ -427,23 +428,38 @@ function countLinesOfCode(string $code): int
     return $count;
 }
 
+/**
+ * Recursive file iterator that prunes excluded directories at descent time.
+ *
+ * vendor/ (third-party dependencies), node_modules/ (frontend packages) and
+ * assets/ (compiled CSS/JS) are skipped as whole subtrees - the old
+ * str_contains() path checks still enumerated every file inside them before
+ * discarding it, which on a repo with a committed vendor tree dominated the
+ * walk.
+ */
+function createSourceIterator(string $directory): RecursiveIteratorIterator
+{
+    $filtered = new RecursiveCallbackFilterIterator(
+        new RecursiveDirectoryIterator($directory, RecursiveDirectoryIterator::SKIP_DOTS),
+        function ($current) {
+            if ($current->isDir()) {
+                return !in_array($current->getFilename(), ['vendor', 'node_modules', 'assets'], true);
+            }
+            return true;
+        }
+    );
+    return new RecursiveIteratorIterator($filtered);
+}
+
 function findPhpFiles(string $directory): array
 {
     $files = [];
     $extensions = ['php', 'module', 'inc', 'install', 'theme', 'profile', 'engine'];
 
-    $iterator = new RecursiveIteratorIterator(
-        new RecursiveDirectoryIterator($directory, RecursiveDirectoryIterator::SKIP_DOTS)
-    );
-
-    foreach ($iterator as $file) {
+    foreach (createSourceIterator($directory) as $file) {
         $path = $file->getPathname();
         if ($file->isFile()
             && in_array($file->getExtension(), $extensions)
-            // /assets: compiled CSS/JS, not PHP source
-            && !str_contains($path, '/assets/')
-            // /vendor: third-party dependencies, not Drupal core code
-            && !str_contains($path, '/vendor/')
             // .api.php: documentation stubs showing hook signatures, not real implementations
             && !str_ends_with($path, '.api.php')
             // .phpstan-baseline.php: auto-generated config, not code (see https://www.drupal.org/node/3426891)
@@ -462,15 +478,9 @@ function findPhpFiles(string $directory): array
  */
 function collectServices(string $directory, SurfaceAreaCollector $surfaceArea): void
 {
-    $iterator = new RecursiveIteratorIterator(
-        new RecursiveDirectoryIterator($directory, RecursiveDirectoryIterator::SKIP_DOTS)
-    );
-
-    foreach ($iterator as $file) {
+    foreach (createSourceIterator($directory) as $file) {
         if ($file->isFile()
             && str_ends_with($file->getFilename(), '.services.yml')
-            && !str_contains($file->getPathname(), '/vendor/')
-            && !str_contains($file->getPathname(), '/assets/')
             && !str_contains($file->getPathname(), '/tests/')
             && !str_contains($file->getPathname(), '/Tests/')) {
 
@@ -1281,103 +1291,6 @@ class CcnVisitor extends NodeVisitorAbstract
  * =============================================================================
  */
 
-if ($argc < 2) {
-    fwrite(STDERR, "Usage: php drupalisms.php /path/to/drupal/core\n");
-    exit(1);
-}
-
-$coreDirectory = $argv[1];
-if (!is_dir($coreDirectory)) {
-    fwrite(STDERR, "Error: Directory not found: $coreDirectory\n");
-    exit(1);
-}
-
-// Set up parser and trackers
-$parser = (new ParserFactory())->createForNewestSupportedVersion();
-$functionMetrics = new FunctionMetricsTracker();
-$antipatterns = new AntipatternTracker($functionMetrics);
-$surfaceArea = new SurfaceAreaCollector();
-
-// Hardcoded YAML formats that use directory-based discovery (not detectable via AST)
-$surfaceArea->addYamlFormat('schema');
-
-// Function boundary visitor must be first to set up function context
-$functionBoundaryVisitor = new FunctionBoundaryVisitor($functionMetrics);
-$ccnVisitor = new CcnVisitor($functionMetrics);
-
-// Anti-pattern visitors
-$serviceLocatorVisitor = new ServiceLocatorVisitor($antipatterns);
-$deepArrayVisitor = new DeepArrayVisitor($antipatterns);
-$deepArrayLiteralVisitor = new DeepArrayLiteralVisitor($antipatterns);
-
-// Surface area visitors
-$magicKeyVisitor = new MagicKeyVisitor($surfaceArea, $antipatterns);
-$hookTypeVisitor = new HookTypeVisitor($surfaceArea);
-$pluginManagerVisitor = new PluginManagerVisitor($surfaceArea);
-$eventSubscriberVisitor = new EventSubscriberVisitor($surfaceArea);
-$yamlFormatVisitor = new YamlFormatVisitor($surfaceArea);
-$interfaceMethodVisitor = new InterfaceMethodVisitor($surfaceArea);
-$globalFunctionVisitor = new GlobalFunctionVisitor($surfaceArea);
-
-// Single traverser with function boundary visitor first
-$traverser = new NodeTraverser();
-$traverser->addVisitor($functionBoundaryVisitor);
-$traverser->addVisitor($ccnVisitor);
-$traverser->addVisitor($serviceLocatorVisitor);
-$traverser->addVisitor($deepArrayVisitor);
-$traverser->addVisitor($deepArrayLiteralVisitor);
-$traverser->addVisitor($magicKeyVisitor);
-$traverser->addVisitor($hookTypeVisitor);
-$traverser->addVisitor($pluginManagerVisitor);
-$traverser->addVisitor($eventSubscriberVisitor);
-$traverser->addVisitor($yamlFormatVisitor);
-$traverser->addVisitor($interfaceMethodVisitor);
-$traverser->addVisitor($globalFunctionVisitor);
-
-// Track total LOC per file for codebase totals
-$productionLoc = 0;
-$testLoc = 0;
-
-// Process all files
-$files = findPhpFiles($coreDirectory);
-$parseErrors = 0;
-
-foreach ($files as $filePath) {
-    try {
-        $code = file_get_contents($filePath);
-        $relativePath = str_replace($coreDirectory . '/', '', $filePath);
-        $isTest = isTestFile($relativePath);
-        $loc = countLinesOfCode($code);
-
-        if ($isTest) {
-            // Test files: only count LOC, skip all other analysis
-            $testLoc += $loc;
-            continue;
-        }
-
-        $productionLoc += $loc;
-
-        $ast = $parser->parse($code);
-        if ($ast !== null) {
-            $functionBoundaryVisitor->setContext($relativePath, $code);
-            $deepArrayLiteralVisitor->resetDepth();
-            $hookTypeVisitor->setCurrentFile($relativePath);
-            $eventSubscriberVisitor->setCurrentFile($relativePath);
-            $interfaceMethodVisitor->setCurrentFile($relativePath);
-            $globalFunctionVisitor->setCurrentFile($relativePath);
-            $traverser->traverse($ast);
-        }
-    } catch (Exception $e) {
-        $parseErrors++;
-    }
-}
-
-// Collect service types from *.services.yml files
-collectServices($coreDirectory, $surfaceArea);
-
-// Get function data (production only - tests were skipped earlier)
-$functions = $functionMetrics->getFunctions();
-
 /**
  * Calculate aggregates from function data.
  */
@@ -1458,28 +1371,197 @@ function getHotspots(array $functions, int $limit = 50): array
     ], $hotspots);
 }
 
-// Add implicit hooks that can't be detected via AST analysis
-$surfaceArea->addImplicitHooks();
-
-// Filter global functions to remove hook implementations (must run after all hooks are known)
-$surfaceArea->filterHookImplementations();
-
-// Totals for commit analysis (sum-based metrics are always meaningful)
-$ccnSum = array_sum(array_column($functions, 'ccn'));
-$miDebtSum = array_sum(array_map(fn($f) => 100 - $f['mi'], $functions));
-
-// Output JSON
-$aggregates = calculateAggregates($functions, $productionLoc);
-$output = [
-    'production' => $aggregates,
-    'testLoc' => $testLoc,
-    'ccnSum' => $ccnSum,
-    'miDebtSum' => $miDebtSum,
-    'hotspots' => getHotspots($functions),
-    'surfaceArea' => $surfaceArea->getCounts(),
-    'surfaceAreaLists' => $surfaceArea->getLists(),
-    'antipatterns' => $antipatterns->getCounts(),
-    'parseErrors' => $parseErrors,
-];
+/**
+ * Run the full analysis pipeline over a single directory tree.
+ *
+ * Trackers and visitors are per-call state, so one process can analyze
+ * several trees (e.g. the aggregate plus each repo subdirectory) without
+ * rebooting the interpreter.
+ */
+function analyzeTree(string $coreDirectory, Parser $parser): array
+{
+    $functionMetrics = new FunctionMetricsTracker();
+    $antipatterns = new AntipatternTracker($functionMetrics);
+    $surfaceArea = new SurfaceAreaCollector();
+
+    // Hardcoded YAML formats that use directory-based discovery (not detectable via AST)
+    $surfaceArea->addYamlFormat('schema');
+
+    // Function boundary visitor must be first to set up function context
+    $functionBoundaryVisitor = new FunctionBoundaryVisitor($functionMetrics);
+    $ccnVisitor = new CcnVisitor($functionMetrics);
+
+    // Anti-pattern visitors
+    $serviceLocatorVisitor = new ServiceLocatorVisitor($antipatterns);
+    $deepArrayVisitor = new DeepArrayVisitor($antipatterns);
+    $deepArrayLiteralVisitor = new DeepArrayLiteralVisitor($antipatterns);
+
+    // Surface area visitors
+    $magicKeyVisitor = new MagicKeyVisitor($surfaceArea, $antipatterns);
+    $hookTypeVisitor = new HookTypeVisitor($surfaceArea);
+    $pluginManagerVisitor = new PluginManagerVisitor($surfaceArea);
+    $eventSubscriberVisitor = new EventSubscriberVisitor($surfaceArea);
+    $yamlFormatVisitor = new YamlFormatVisitor($surfaceArea);
+    $interfaceMethodVisitor = new InterfaceMethodVisitor($surfaceArea);
+    $globalFunctionVisitor = new GlobalFunctionVisitor($surfaceArea);
+
+    // Single traverser with function boundary visitor first
+    $traverser = new NodeTraverser();
+    $traverser->addVisitor($functionBoundaryVisitor);
+    $traverser->addVisitor($ccnVisitor);
+    $traverser->addVisitor($serviceLocatorVisitor);
+    $traverser->addVisitor($deepArrayVisitor);
+    $traverser->addVisitor($deepArrayLiteralVisitor);
+    $traverser->addVisitor($magicKeyVisitor);
+    $traverser->addVisitor($hookTypeVisitor);
+    $traverser->addVisitor($pluginManagerVisitor);
+    $traverser->addVisitor($eventSubscriberVisitor);
+    $traverser->addVisitor($yamlFormatVisitor);
+    $traverser->addVisitor($interfaceMethodVisitor);
+    $traverser->addVisitor($globalFunctionVisitor);
+
+    // Track total LOC per file for codebase totals
+    $productionLoc = 0;
+    $testLoc = 0;
+
+    // Process all files
+    $files = findPhpFiles($coreDirectory);
+    $parseErrors = 0;
+
+    foreach ($files as $filePath) {
+        try {
+            $code = file_get_contents($filePath);
+            $relativePath = str_replace($coreDirectory . '/', '', $filePath);
+            $isTest = isTestFile($relativePath);
+            $loc = countLinesOfCode($code);
+
+            if ($isTest) {
+                // Test files: only count LOC, skip all other analysis
+                $testLoc += $loc;
+                continue;
+            }
+
+            $productionLoc += $loc;
+
+            $ast = $parser->parse($code);
+            if ($ast !== null) {
+                $functionBoundaryVisitor->setContext($relativePath, $code);
+                $deepArrayLiteralVisitor->resetDepth();
+                $hookTypeVisitor->setCurrentFile($relativePath);
+                $eventSubscriberVisitor->setCurrentFile($relativePath);
+                $interfaceMethodVisitor->setCurrentFile($relativePath);
+                $globalFunctionVisitor->setCurrentFile($relativePath);
+                $traverser->traverse($ast);
+            }
+        } catch (Exception $e) {
+            $parseErrors++;
+        }
+    }
+
+    // Collect service types from *.services.yml files
+    collectServices($coreDirectory, $surfaceArea);
+
+    // Get function data (production only - tests were skipped earlier)
+    $functions = $functionMetrics->getFunctions();
+
+    // Add implicit hooks that can't be detected via AST analysis
+    $surfaceArea->addImplicitHooks();
+
+    // Filter global functions to remove hook implementations (must run after all hooks are known)
+    $surfaceArea->filterHookImplementations();
+
+    // Totals for commit analysis (sum-based metrics are always meaningful)
+    $ccnSum = array_sum(array_column($functions, 'ccn'));
+    $miDebtSum = array_sum(array_map(fn($f) => 100 - $f['mi'], $functions));
+
+    return [
+        'production' => calculateAggregates($functions, $productionLoc),
+        'testLoc' => $testLoc,
+        'ccnSum' => $ccnSum,
+        'miDebtSum' => $miDebtSum,
+        'hotspots' => getHotspots($functions),
+        'surfaceArea' => $surfaceArea->getCounts(),
+        'surfaceAreaLists' => $surfaceArea->getLists(),
+        'antipatterns' => $antipatterns->getCounts(),
+        'parseErrors' => $parseErrors,
+    ];
+}
+
+/**
+ * Analyze a tree, optionally adding the per-top-level-subdirectory map.
+ *
+ * With --per-subdir, each top-level subdirectory (one exported repo per
+ * subdir) is analyzed in the same process: one interpreter boot covers
+ * the aggregate plus every repo instead of N+1 boots.
+ */
+function analyzeTreeWithSubdirs(string $coreDirectory, Parser $parser, bool $perSubdir): array
+{
+    $output = analyzeTree($coreDirectory, $parser);
+
+    if ($perSubdir) {
+        $perSubdirResults = [];
+        foreach (new DirectoryIterator($coreDirectory) as $entry) {
+            if ($entry->isDir() && !$entry->isDot()) {
+                $perSubdirResults[$entry->getFilename()] = analyzeTree($entry->getPathname(), $parser);
+            }
+        }
+        ksort($perSubdirResults);
+        $output['perSubdir'] = $perSubdirResults;
+    }
+
+    return $output;
+}
+
+if ($argc < 2) {
+    fwrite(STDERR, "Usage: php drupalisms.php [--per-subdir] (/path/to/drupal/core | --batch)\n");
+    exit(1);
+}
+
+$perSubdir = false;
+$batch = false;
+$paths = [];
+foreach (array_slice($argv, 1) as $arg) {
+    if ($arg === '--per-subdir') {
+        $perSubdir = true;
+    } elseif ($arg === '--batch') {
+        $batch = true;
+    } else {
+        $paths[] = $arg;
+    }
+}
+
+if (count($paths) !== ($batch ? 0 : 1)) {
+    fwrite(STDERR, "Usage: php drupalisms.php [--per-subdir] (/path/to/drupal/core | --batch)\n");
+    exit(1);
+}
+
+// Set up parser once; analyzeTree carries no state between calls
+$parser = (new ParserFactory())->createForNewestSupportedVersion();
+
+// --batch: read one directory per line on stdin and emit one compact
+// JSON result per line, until stdin closes. The interpreter and the
+// Composer autoloader boot once for the whole stream of trees.
+if ($batch) {
+    while (($line = fgets(STDIN)) !== false) {
+        $directory = rtrim(trim($line), '/');
+        if ($directory === '') {
+            continue;
+        }
+        if (!is_dir($directory)) {
+            echo json_encode(['error' => "Directory not found: $directory"]) . "\n";
+        } else {
+            echo json_encode(analyzeTreeWithSubdirs($directory, $parser, $perSubdir)) . "\n";
+        }
+        flush();
+    }
+    exit(0);
+}
+
+$coreDirectory = rtrim($paths[0], '/');
+if (!is_dir($coreDirectory)) {
+    fwrite(STDERR, "Error: Directory not found: $coreDirectory\n");
+    exit(1);
+}
 
+$output = analyzeTreeWithSubdirs($coreDirectory, $parser, $perSubdir);
 echo json_encode($output, JSON_PRETTY_PRINT) . "\n";